@@ -4,6 +4,9 @@
 #   TELEGRAM_BOT_TOKEN = <BotFather token>
 #   ALLOWED_CHAT_ID    = 0                      # (setup mode) OR a single chat id like -100123...
 #   ALLOWED_CHAT_IDS   = -1001111,-1002222      # (optional multi-group, comma-separated)
+#   STATE_DB           = state.db               # (optional) SQLite file that persists streaks across restarts
+#   PUBLIC_URL         = https://<app>.onrender.com  # (optional) run as a webhook Web Service instead of polling
+#   PORT               = 10000                  # (set by Render for Web Services; used with PUBLIC_URL)
 #
 # What’s new in this version:
 # - "कुल सदस्य" now uses the LIVE Telegram count via get_chat_member_count
@@ -14,12 +17,19 @@
 import os
 import asyncio
 import hashlib
-from collections import defaultdict
-from datetime import datetime, timedelta, time
-from zoneinfo import ZoneInfo
+import html
+import sqlite3
+import sys
+from bisect import bisect_left, insort
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta, time, timezone
+from functools import lru_cache
+from time import monotonic, time as unix_time
+from typing import Optional
 
 from telegram import Update, ChatMemberUpdated
 from telegram.ext import (
+    AIORateLimiter,
     ApplicationBuilder,
     CommandHandler,
     MessageHandler,
@@ -30,7 +40,7 @@ from telegram.ext import (
 
 # ---------- Config ----------
 TOKEN = os.environ["TELEGRAM_BOT_TOKEN"]
-IST = ZoneInfo("Asia/Kolkata")
+IST = timezone(timedelta(hours=5, minutes=30), name="IST")  # India has no DST; no tzdata lookup needed
 
 # Allow one or many groups. If neither provided, ALLOWED_CHAT_ID=0 means "setup mode" so /id works anywhere.
 _raw_ids = os.environ.get("ALLOWED_CHAT_IDS")
@@ -40,32 +50,138 @@ else:
     ALLOWED_CHAT_ID = int(os.environ.get("ALLOWED_CHAT_ID", "0"))
     ALLOWED_CHAT_IDS = set() if ALLOWED_CHAT_ID == 0 else {ALLOWED_CHAT_ID}
 
-print("TOKEN_FINGERPRINT:", hashlib.sha256(TOKEN.encode()).hexdigest()[:12])
+STATE_DB = os.environ.get("STATE_DB", "state.db")
+# Webhook mode when PUBLIC_URL is set (Render Web Service); otherwise long polling (Background Worker)
+PUBLIC_URL = os.environ.get("PUBLIC_URL", "").rstrip("/")
+# Only what the handlers consume: messages (photos + commands) and member joins
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CHAT_MEMBER]
+
+print("TOKEN_FINGERPRINT:", hashlib.blake2b(TOKEN.encode(), digest_size=6).hexdigest())
 print("ALLOWED_CHAT_IDS:", sorted(list(ALLOWED_CHAT_IDS)) if ALLOWED_CHAT_IDS else "ANY (setup mode)")
 
 # ---------- In-memory State (per chat) ----------
-# submissions[chat_id][date][user_id] = {"name": str, "time": "HH:MM"}
-submissions = defaultdict(lambda: defaultdict(dict))
-# streaks[chat_id][user_id] = int
-streaks = defaultdict(lambda: defaultdict(int))
-# last_submission_date[chat_id][user_id] = "YYYY-MM-DD"
-last_submission_date = defaultdict(dict)
+# submissions_today[chat_id][user_id] = (name, "HH:MM"), only for submissions_date
+submissions_today = {}
+submissions_date = ""
+# Per-user values are point lookups only, so they live in flat dicts keyed by (chat_id, user_id)
+# streaks[(chat_id, user_id)] = int
+streaks = {}
+# last_submission_date[(chat_id, user_id)] = "YYYY-MM-DD"
+last_submission_date = {}
 # known_users[chat_id][user_id] = "FirstName"
 known_users = defaultdict(dict)
+# pending_acks[chat_id] = ["FirstName", ...] awaiting the next batched acknowledgement
+pending_acks = defaultdict(list)
+# _summary_cache[chat_id] = (date, rendered leaderboard + awards); _summary_dirty = chats to re-render
+_summary_cache = {}
+_summary_dirty = set()
+# streak_board[chat_id] = sorted [(-streak, user_id), ...], best streak first
+streak_board = defaultdict(list)
+# _member_count_cache[chat_id] = (fetched_at_monotonic, count)
+_member_count_cache = {}
+
+# ---------- Persistent State (SQLite, write-through; memory stays the read path) ----------
+db = None
+
+def open_state_db(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS submissions (
+            chat_id INTEGER, date TEXT, user_id INTEGER, name TEXT, time TEXT,
+            PRIMARY KEY (chat_id, date, user_id)
+        );
+        CREATE TABLE IF NOT EXISTS streaks (
+            chat_id INTEGER, user_id INTEGER, streak INTEGER, last_date TEXT,
+            PRIMARY KEY (chat_id, user_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_streak ON streaks (chat_id, streak DESC, user_id);
+        CREATE TABLE IF NOT EXISTS known_users (
+            chat_id INTEGER, user_id INTEGER, name TEXT,
+            PRIMARY KEY (chat_id, user_id)
+        );
+    """)
+    return conn
+
+def load_state():
+    global db, submissions_date
+    db = open_state_db(STATE_DB)
+    submissions_date = today_str()
+    with db:
+        db.execute("DELETE FROM submissions WHERE date != ?", (submissions_date,))
+    for chat_id, user_id, name in db.execute("SELECT chat_id, user_id, name FROM known_users"):
+        known_users[chat_id][user_id] = sys.intern(name)
+    for chat_id, user_id, name, hm in db.execute("SELECT chat_id, user_id, name, time FROM submissions"):
+        submissions_today.setdefault(chat_id, {})[user_id] = (sys.intern(name), hm)
+    # idx_streak yields rows already in streak_board order, so boards are built by appending
+    for chat_id, user_id, streak, last_date in db.execute(
+        "SELECT chat_id, user_id, streak, last_date FROM streaks ORDER BY chat_id, streak DESC, user_id"
+    ):
+        streaks[(chat_id, user_id)] = streak
+        last_submission_date[(chat_id, user_id)] = last_date
+        streak_board[chat_id].append((-streak, user_id))
+
+def save_known_user(chat_id: int, user_id: int, name: str):
+    with db:
+        db.execute("INSERT OR REPLACE INTO known_users VALUES (?, ?, ?)", (chat_id, user_id, name))
+
+def roll_submissions(date: str):
+    # Only today's submissions are ever read; drop the previous day's on first sight of a new date
+    global submissions_date
+    if date <= submissions_date:
+        return
+    submissions_today.clear()
+    submissions_date = date
+    with db:
+        db.execute("DELETE FROM submissions WHERE date != ?", (date,))
+
+def save_submission(chat_id: int, date: str, user_id: int, name: str, hm: str, streak: int):
+    with db:
+        db.execute("INSERT OR REPLACE INTO submissions VALUES (?, ?, ?, ?, ?)", (chat_id, date, user_id, name, hm))
+        db.execute(
+            "INSERT INTO streaks VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (chat_id, user_id) DO UPDATE SET streak = excluded.streak, last_date = excluded.last_date",
+            (chat_id, user_id, streak, date),
+        )
+
+def ymd(dt: datetime) -> str:
+    # Integer formatting; avoids strftime's locale machinery on the hot path
+    return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d}"
+
+@lru_cache(maxsize=1)
+def _clock_for_minute(minute: int) -> tuple[str, str, str]:
+    # IST midnight falls on a minute boundary, so all three strings are constant within a minute
+    dt = datetime.fromtimestamp(minute * 60, tz=IST)
+    return ymd(dt), ymd(dt - timedelta(days=1)), f"{dt.hour:02d}:{dt.minute:02d}"
+
+def clock_strings() -> tuple[str, str, str]:
+    # (today "YYYY-MM-DD", yesterday "YYYY-MM-DD", now "HH:MM") in IST, formatted once per minute
+    return _clock_for_minute(int(unix_time() // 60))
 
 def today_str():
-    return datetime.now(tz=IST).strftime("%Y-%m-%d")
-
-def is_allowed_chat(chat_id: int) -> bool:
-    if not ALLOWED_CHAT_IDS:
-        return True  # setup mode so /id works anywhere
-    return chat_id in ALLOWED_CHAT_IDS
+    return clock_strings()[0]
+
+async def get_cached_member_count(bot, chat_id: int, ttl: float = 60) -> int:
+    # Scheduled summaries, /report and repeated /members calls reuse one fetch within the TTL
+    cached = _member_count_cache.get(chat_id)
+    if cached and monotonic() - cached[0] < ttl:
+        return cached[1]
+    count = await bot.get_chat_member_count(chat_id=chat_id)
+    _member_count_cache[chat_id] = (monotonic(), count)
+    return count
+
+def update_leaderboard(chat_id: int, user_id: int, old: int, new: int):
+    board = streak_board[chat_id]
+    if old:
+        del board[bisect_left(board, (-old, user_id))]
+    insort(board, (-new, user_id))
+
+def top_streaks_for_chat(chat_id: int, n: int = 5):
+    return [(uid, -neg) for neg, uid in streak_board[chat_id][:n]]
 
 # ---------- Commands ----------
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat = update.effective_chat
-    if not chat or not is_allowed_chat(chat.id):
-        return
     await update.message.reply_text("🙏 स्वागत है! कृपया हर दिन अपने आंगनवाड़ी की फ़ोटो इस समूह में भेजें।")
 
 async def cmd_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -76,28 +192,19 @@ async def cmd_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def cmd_members(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat = update.effective_chat
-    if not chat or not is_allowed_chat(chat.id):
-        return
-    count = await context.bot.get_chat_member_count(chat_id=chat.id)
+    count = await get_cached_member_count(context.bot, chat.id)
     await update.message.reply_text(f"👥 Group members right now: {count}")
 
 async def cmd_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat = update.effective_chat
-    if not chat or not is_allowed_chat(chat.id):
-        return
     await post_summary_for_chat(context, chat.id)
-    await asyncio.sleep(1)
-    await post_awards_for_chat(context, chat.id)
 
 async def cmd_pending(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat = update.effective_chat
-    if not chat or not is_allowed_chat(chat.id):
-        return
-    date = today_str()
-    today_ids = set(submissions[chat.id].get(date, {}).keys())
-    member_ids = set(known_users[chat.id].keys())
-    pending_ids = [uid for uid in member_ids if uid not in today_ids]
-    names = [known_users[chat.id].get(uid, f"User {uid}") for uid in pending_ids]
+    members = known_users[chat.id]
+    roll_submissions(today_str())
+    pending_ids = members.keys() - submissions_today.get(chat.id, {}).keys()
+    names = [members[uid] for uid in pending_ids]
     if not names:
         await update.message.reply_text("✅ आज किसी की रिपोर्ट पेंडिंग नहीं है.")
         return
@@ -108,157 +215,235 @@ async def cmd_pending(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def track_new_members(update: Update, context: ContextTypes.DEFAULT_TYPE):
     m: ChatMemberUpdated = update.chat_member
     chat_id = m.chat.id
-    if not is_allowed_chat(chat_id):
-        return
     member = m.new_chat_member
     if member.status in {"member", "administrator"}:
         user = member.user
-        known_users[chat_id][user.id] = user.first_name or "User"
+        known_users[chat_id][user.id] = sys.intern(user.first_name or "User")
+        save_known_user(chat_id, user.id, known_users[chat_id][user.id])
+        _summary_dirty.add(chat_id)
 
 # ---------- Photo handling ----------
 # Treats first photo per user per day as the submission. Albums count as one via media_group_id.
-media_group_seen = set()
+# Bounded FIFO of (chat_id, media_group_id) so long uptimes don't grow memory forever.
+MEDIA_GROUP_CACHE_SIZE = 4096
+media_group_seen = OrderedDict()
+
+def first_in_media_group(chat_id: int, mgid: str) -> bool:
+    # Test-and-set with no await in between, so it is atomic on the event loop
+    # even when updates are processed concurrently.
+    key = (chat_id, mgid)
+    if key in media_group_seen:
+        return False
+    media_group_seen[key] = None
+    if len(media_group_seen) > MEDIA_GROUP_CACHE_SIZE:
+        media_group_seen.popitem(last=False)
+    return True
 
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat = update.effective_chat
-    if not chat or not is_allowed_chat(chat.id):
-        return
     msg = update.message
     if not msg or not msg.photo:
         return
 
     # Collapse albums into one submission
     mgid = msg.media_group_id
-    if mgid:
-        if mgid in media_group_seen:
-            return
-        media_group_seen.add(mgid)
+    if mgid and not first_in_media_group(chat.id, mgid):
+        return
 
     user = update.effective_user
     if not user:
         return
     chat_id = chat.id
     user_id = user.id
-    name = user.first_name or "User"
-    known_users[chat_id][user_id] = name
-
-    date = today_str()
-    now = datetime.now(tz=IST).strftime("%H:%M")
-
-    submissions[chat_id].setdefault(date, {})
-    if user_id in submissions[chat_id][date]:
+    # Interned: first names repeat heavily across members and groups
+    name = sys.intern(user.first_name or "User")
+    if known_users[chat_id].get(user_id) != name:
+        # New member or renamed; repeat submitters (the steady state) skip the write
+        known_users[chat_id][user_id] = name
+        save_known_user(chat_id, user_id, name)
+        _summary_dirty.add(chat_id)
+
+    date, yesterday, now = clock_strings()
+
+    roll_submissions(date)
+    chat_submissions = submissions_today.setdefault(chat_id, {})
+    if user_id in chat_submissions:
         # Already submitted today; gently acknowledge to reduce spam
         return
 
-    submissions[chat_id][date][user_id] = {"name": name, "time": now}
-
-    prev_date = last_submission_date[chat_id].get(user_id)
-    yesterday = (datetime.now(tz=IST) - timedelta(days=1)).strftime("%Y-%m-%d")
-    if prev_date == yesterday:
-        streaks[chat_id][user_id] = streaks[chat_id].get(user_id, 0) + 1
-    else:
-        streaks[chat_id][user_id] = 1
-    last_submission_date[chat_id][user_id] = date
-
-    await context.bot.send_message(
-        chat_id=chat_id,
-        text=f"✅ {name}, आपकी आज की फ़ोटो दर्ज कर ली गई है। बहुत अच्छे!"
+    chat_submissions[user_id] = (name, now)
+
+    key = (chat_id, user_id)
+    prev_date = last_submission_date.get(key)
+    old_streak = streaks.get(key, 0)
+    streak = old_streak + 1 if prev_date == yesterday else 1
+    streaks[key] = streak
+    last_submission_date[key] = date
+    update_leaderboard(chat_id, user_id, old_streak, streak)
+    _summary_dirty.add(chat_id)
+    save_submission(chat_id, date, user_id, name, now, streak)
+
+    # Acknowledged in batches by flush_acks to stay under the per-group message limit
+    pending_acks[chat_id].append(name)
+
+async def flush_acks(context: ContextTypes.DEFAULT_TYPE):
+    # Sends overlap across chats; AIORateLimiter keeps the burst within Telegram's limits
+    batches = [(chat_id, pending_acks.pop(chat_id)) for chat_id in list(pending_acks)]
+    results = await asyncio.gather(
+        *(
+            context.bot.send_message(
+                chat_id=chat_id,
+                text=f"✅ आज की फ़ोटो दर्ज: {', '.join(names)}। बहुत अच्छे!"
+            )
+            for chat_id, names in batches
+        ),
+        return_exceptions=True,
     )
+    for (chat_id, _), result in zip(batches, results):
+        if isinstance(result, Exception):
+            print(f"Ack failed for chat {chat_id}: {result!r}")
 
-# ---------- Summary & Awards (LIVE member count) ----------
-async def _build_summary_text(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> str:
-    date = today_str()
+# ---------- Summary + Awards (LIVE member count, one message) ----------
+async def _build_summary_text(context: ContextTypes.DEFAULT_TYPE, chat_id: int, now_dt: Optional[datetime] = None) -> str:
+    now_dt = now_dt or datetime.now(tz=IST)
+    date = ymd(now_dt)
 
     # LIVE total member count from Telegram
-    total_members = await context.bot.get_chat_member_count(chat_id=chat_id)
+    total_members = await get_cached_member_count(context.bot, chat_id)
 
-    today_data = submissions[chat_id].get(date, {})
-    today_ids = set(today_data.keys())
+    roll_submissions(date)
+    submitted_count = len(submissions_today.get(chat_id, ()))
 
     # Pending = live total - submitted today
-    pending_count = max(0, total_members - len(today_ids))
+    pending_count = max(0, total_members - submitted_count)
 
-    # Top streaks (among people we have tracked)
-    tracked_ids = set(known_users[chat_id].keys()) | set(today_ids)
-    top_streaks = sorted(
-        [(uid, streaks[chat_id].get(uid, 0)) for uid in tracked_ids],
-        key=lambda x: x[1],
-        reverse=True
-    )[:5]
+    summary = (
+        f"📊 {now_dt.strftime('%I:%M %p')} समूह रिपोर्ट:\n\n"
+        f"👥 कुल सदस्य: {total_members}\n"
+        f"✅ आज रिपोर्ट भेजी: {submitted_count}\n"
+        f"⏳ रिपोर्ट नहीं भेजी: {pending_count}\n\n"
+        f"{_streak_section(chat_id, date)}"
+    )
+    return summary
+
+def _streak_section(chat_id: int, date: str) -> str:
+    # Leaderboard + awards only change when handle_photo/track_new_members mark the chat dirty
+    cached = _summary_cache.get(chat_id)
+    if chat_id not in _summary_dirty and cached and cached[0] == date:
+        return cached[1]
+
+    # Top streaks (maintained incrementally in handle_photo)
+    top_streaks = top_streaks_for_chat(chat_id)
 
     leaderboard = "\n".join(
-        f"{i+1}. {known_users[chat_id].get(uid, 'User')} – {count} दिन"
+        f"{i+1}. {html.escape(known_users[chat_id].get(uid, 'User'))} – {count} दिन"
         for i, (uid, count) in enumerate(top_streaks) if count > 0
     )
-
-    summary = (
-        f"📊 {datetime.now(tz=IST).strftime('%I:%M %p')} समूह रिपोर्ट:\n\n"
-        f"👥 कुल सदस्य: {total_members}\n"
-        f"✅ आज रिपोर्ट भेजी: {len(today_ids)}\n"
-        f"⏳ रिपोर्ट नहीं भेजी: {pending_count}\n\n"
+    section = (
         f"🏆 लगातार रिपोर्टिंग करने वाले:\n"
         f"{leaderboard if leaderboard else 'अभी कोई डेटा उपलब्ध नहीं है।'}"
     )
-    return summary
-
-async def post_summary_for_chat(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
-    text = await _build_summary_text(context, chat_id)
-    await context.bot.send_message(chat_id=chat_id, text=text)
-
-async def post_awards_for_chat(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
-    member_ids = set(known_users[chat_id].keys())
-    top_streaks = sorted(
-        [(uid, streaks[chat_id].get(uid, 0)) for uid in member_ids],
-        key=lambda x: x[1],
-        reverse=True
-    )[:5]
-    if not top_streaks or top_streaks[0][1] == 0:
-        return
-    medals = ["🥇", "🥈", "🥉", "🎖️", "🏅"]
-    for i, (uid, count) in enumerate(top_streaks):
-        name = known_users[chat_id].get(uid, f"User {uid}")
-        msg = f"{medals[i]} *{name}*, आप आज #{i+1} स्थान पर हैं — {count} दिनों की शानदार रिपोर्टिंग के साथ! 🎉👏"
-        await context.bot.send_message(chat_id=chat_id, text=msg, parse_mode="Markdown")
-        await asyncio.sleep(0.5)
+    awards = _build_awards_text(chat_id, top_streaks)
+    if awards:
+        section += f"\n\n{awards}"
+
+    _summary_cache[chat_id] = (date, section)
+    _summary_dirty.discard(chat_id)
+    return section
+
+# One template per rank with medal and position already filled in
+_AWARD_FMTS = tuple(
+    f"{medal} <b>{{name}}</b>, आप आज #{i+1} स्थान पर हैं — {{count}} दिनों की शानदार रिपोर्टिंग के साथ! 🎉👏"
+    for i, medal in enumerate(("🥇", "🥈", "🥉", "🎖️", "🏅"))
+)
 
-# ---------- JobQueue (daily schedules per chat) ----------
-async def job_summary(context: ContextTypes.DEFAULT_TYPE):
-    await post_summary_for_chat(context, context.job.data)
+def _build_awards_text(chat_id: int, top_streaks) -> str:
+    names = known_users[chat_id]
+    return "\n\n".join(
+        _AWARD_FMTS[i].format(name=html.escape(names.get(uid, f"User {uid}")), count=count)
+        for i, (uid, count) in enumerate(top_streaks)
+    )
 
-async def job_awards(context: ContextTypes.DEFAULT_TYPE):
-    await post_awards_for_chat(context, context.job.data)
+async def post_summary_for_chat(context: ContextTypes.DEFAULT_TYPE, chat_id: int, now_dt: Optional[datetime] = None):
+    # Summary and medal awards go out as a single HTML message; every name is html-escaped
+    text = await _build_summary_text(context, chat_id, now_dt)
+    await context.bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
+
+# ---------- JobQueue (daily schedules, all chats per run) ----------
+async def job_reset_submissions(context: ContextTypes.DEFAULT_TYPE):
+    roll_submissions(today_str())
+
+async def job_summary_all(context: ContextTypes.DEFAULT_TYPE):
+    # Fan out to every group at once; one failing chat must not block the others
+    chat_ids = list(ALLOWED_CHAT_IDS)
+    now_dt = datetime.now(tz=IST)
+    results = await asyncio.gather(
+        *(post_summary_for_chat(context, cid, now_dt) for cid in chat_ids),
+        return_exceptions=True,
+    )
+    for cid, result in zip(chat_ids, results):
+        if isinstance(result, Exception):
+            print(f"Summary failed for chat {cid}: {result!r}")
 
 def schedule_reports(app):
     jq = app.job_queue
+    jq.run_repeating(callback=flush_acks, interval=30, first=30)
+    jq.run_daily(callback=job_reset_submissions, time=time(hour=0, minute=0, tzinfo=IST))
     times = [(10,0), (14,0), (18,0)]  # IST
     if not ALLOWED_CHAT_IDS:
         # In setup mode we don't know target chats; skip scheduling.
         return
-    for cid in ALLOWED_CHAT_IDS:
-        for hh, mm in times:
-            jq.run_daily(callback=job_summary, time=time(hour=hh, minute=0, tzinfo=IST), data=cid)
-            jq.run_daily(callback=job_awards,  time=time(hour=hh, minute=2, tzinfo=IST), data=cid)
+    for hh, mm in times:
+        jq.run_daily(callback=job_summary_all, time=time(hour=hh, minute=mm, tzinfo=IST))
 
 # ---------- Entrypoint ----------
 def main():
-    app = ApplicationBuilder().token(TOKEN).build()
+    load_state()
+    # PTB already pools 256 connections for bot calls; wait for a free slot during
+    # concurrent fan-outs instead of failing after the 1s default pool timeout.
+    # AIORateLimiter paces sends just under Telegram's 30/s global and 20/min per-group limits.
+    # Updates are handled concurrently so a slow /report in one group doesn't stall the others;
+    # state mutations in the handlers contain no await, so they stay atomic on the event loop.
+    app = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .concurrent_updates(True)
+        .pool_timeout(10)
+        .rate_limiter(AIORateLimiter(overall_max_rate=28, group_max_rate=19, group_time_period=60))
+        .build()
+    )
+
+    # Allowed chats are filtered by PTB before any handler runs (setup mode accepts all)
+    chat_filter = filters.Chat(chat_id=ALLOWED_CHAT_IDS) if ALLOWED_CHAT_IDS else filters.ALL
 
     # Commands
-    app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("start", start, filters=chat_filter))
     app.add_handler(CommandHandler("id", cmd_id))           # keep for onboarding new groups
-    app.add_handler(CommandHandler("members", cmd_members))  # live member count
-    app.add_handler(CommandHandler("report", cmd_report))    # summary + awards
-    app.add_handler(CommandHandler("pending", cmd_pending))  # compact pending view
+    app.add_handler(CommandHandler("members", cmd_members, filters=chat_filter))  # live member count
+    app.add_handler(CommandHandler("report", cmd_report, filters=chat_filter))    # summary + awards
+    app.add_handler(CommandHandler("pending", cmd_pending, filters=chat_filter))  # compact pending view
 
     # Messages
-    app.add_handler(MessageHandler(filters.PHOTO & filters.ChatType.GROUPS, handle_photo))
+    app.add_handler(MessageHandler(filters.PHOTO & filters.ChatType.GROUPS & chat_filter, handle_photo))
 
     # Membership changes
-    app.add_handler(ChatMemberHandler(track_new_members, ChatMemberHandler.CHAT_MEMBER))
+    # An empty chat_id set accepts every chat, matching setup mode
+    app.add_handler(ChatMemberHandler(track_new_members, ChatMemberHandler.CHAT_MEMBER, chat_id=ALLOWED_CHAT_IDS))
 
     schedule_reports(app)
     print("Bot online. Waiting for updates...")
-    app.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
+    if PUBLIC_URL:
+        app.run_webhook(
+            listen="0.0.0.0",
+            port=int(os.environ.get("PORT", "8443")),
+            url_path=TOKEN,
+            webhook_url=f"{PUBLIC_URL}/{TOKEN}",
+            allowed_updates=ALLOWED_UPDATES,
+            drop_pending_updates=True,
+        )
+    else:
+        # 30s long poll: Telegram holds the request open instead of answering empty every 10s
+        app.run_polling(allowed_updates=ALLOWED_UPDATES, poll_interval=0.0, timeout=30, drop_pending_updates=True)
 
 if __name__ == "__main__":
     main()